@@ -4,11 +4,12 @@ import os.path
 import re
 import io
 import json
+import hashlib
 import asyncio
 import pytz
 import time
 import requests
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from datetime import datetime, timedelta
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
@@ -18,7 +19,12 @@ from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- Anvil Uplink Initialization ---
 # Make sure to set your Anvil Uplink key in the Anvil app settings
@@ -48,6 +54,9 @@ class GoogleSheet:
         self.drive_service = build('drive', 'v3', credentials=self.creds)
         self.all_data = {}
         self.sheet_data_timestamp = None
+        self._apartment_row_index = {}
+        self._apartments_by_realtor = {}
+        self._row_indexes = {}
         self.settings_file = "drive_module_settings.json"
         self.settings = self._load_settings()
 
@@ -77,10 +86,9 @@ class GoogleSheet:
             url = "https://www.cursbnr.ro/"
             response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            eur_row = soup.find('td', string='EUR').find_parent('tr')
-            rate_cell = eur_row.find_all('td')[2]
-            base_rate = float(rate_cell.text.strip())
+            tree = lxml_html.fromstring(response.content)
+            rate_text = tree.xpath("//tr[td[normalize-space(.)='EUR']]/td[3]")[0].text_content()
+            base_rate = float(rate_text.strip())
             rate_with_margin = round(base_rate * 1.003, 4)
             current_rate = self.settings.get("eur_to_ron_rate")
             if current_rate != rate_with_margin:
@@ -95,31 +103,55 @@ class GoogleSheet:
     def load_data(self):
         if self.sheet_data_timestamp and (datetime.now(pytz.utc) - self.sheet_data_timestamp).total_seconds() < 600:
             return
-        for sheet_name in self.sheet_names:
-            worksheet = self.spreadsheet.worksheet(sheet_name)
-            header = worksheet.row_values(1)
-            data = worksheet.get_all_records(expected_headers=header)
+        response = self.spreadsheet.values_batch_get(ranges=[f"'{name}'!A:ZZ" for name in self.sheet_names])
+        for sheet_name, value_range in zip(self.sheet_names, response.get('valueRanges', [])):
+            values = value_range.get('values', [])
+            header = values[0] if values else []
+            width = len(header)
+            data = [
+                dict(zip(header, [cell.strip() if isinstance(cell, str) else cell for cell in row] + [''] * (width - len(row))))
+                for row in values[1:]
+            ]
             self.all_data[sheet_name] = {
                 'header': header,
                 'data': data
             }
+        self._build_apartment_index()
+        self._row_indexes = {}
         self.sheet_data_timestamp = datetime.now(pytz.utc)
 
+    def _build_apartment_index(self):
+        self._apartment_row_index = {}
+        self._apartments_by_realtor = {}
+        for row in self.all_data.get("APARTMENTS", {}).get('data', []):
+            code = str(row.get("AP CODE", "")).strip().upper()
+            if code and code not in self._apartment_row_index:
+                self._apartment_row_index[code] = row
+            realtor = row.get("REALTOR")
+            if realtor:
+                self._apartments_by_realtor.setdefault(realtor, []).append(row.get('AP CODE'))
+
     def get_row_by_code(self, ap_code: str, sheet_name: str, code_column_name: str) -> dict | None:
         if sheet_name not in self.all_data:
             return None
-        for row in self.all_data[sheet_name]['data']:
-            if row.get(code_column_name) == ap_code:
-                return row
-        return None
+        index_key = (sheet_name, code_column_name)
+        index = self._row_indexes.get(index_key)
+        if index is None:
+            index = {}
+            for row in self.all_data[sheet_name]['data']:
+                value = row.get(code_column_name)
+                if value is not None and value not in index:
+                    index[value] = row
+            self._row_indexes[index_key] = index
+        return index.get(ap_code)
 
     def get_apartment_data(self, ap_code: str, sheet_name: str = "APARTMENTS") -> dict | None:
+        if sheet_name == "APARTMENTS":
+            return self._apartment_row_index.get(str(ap_code).strip().upper())
         return self.get_row_by_code(ap_code, sheet_name, "AP CODE")
 
     def get_apartments_by_realtor(self, realtor_name: str) -> list:
-        sheet_name = "APARTMENTS"
-        if sheet_name not in self.all_data: return []
-        return [row['AP CODE'] for row in self.all_data[sheet_name]['data'] if row.get('REALTOR') == realtor_name]
+        return list(self._apartments_by_realtor.get(realtor_name, []))
 
     # ... other GoogleSheet methods ...
 
@@ -128,19 +160,45 @@ class TodoManager:
     def __init__(self, sheet_manager: GoogleSheet):
         self.sheet_manager = sheet_manager
         self.todo_file_name = "todo_list.json"
-        self.file_id = None
+        self.file_id_cache_file = ".todo_file_id"
+        self.file_id = self._load_cached_file_id()
+        self._last_saved_hash = None
         self.todo_list = self._load_list_from_drive()
         self.trash_bin = []
 
+    def _load_cached_file_id(self) -> str | None:
+        if os.path.exists(self.file_id_cache_file):
+            try:
+                with open(self.file_id_cache_file, 'r') as f:
+                    return f.read().strip() or None
+            except OSError:
+                return None
+        return None
+
+    def _cache_file_id(self, file_id: str):
+        try:
+            with open(self.file_id_cache_file, 'w') as f:
+                f.write(file_id)
+        except OSError:
+            pass
+
+    def _invalidate_cached_file_id(self):
+        self.file_id = None
+        try:
+            os.remove(self.file_id_cache_file)
+        except OSError:
+            pass
+
     def _find_file_id(self):
         if self.file_id:
             return self.file_id
         try:
             query = f"name = '{self.todo_file_name}' and 'root' in parents and trashed = false"
-            results = self.sheet_manager.drive_service.files().list(q=query, fields="files(id)").execute()
+            results = self.sheet_manager.drive_service.files().list(q=query, fields="files(id)", pageSize=1).execute()
             items = results.get("files", [])
             if items:
                 self.file_id = items[0]["id"]
+                self._cache_file_id(self.file_id)
                 return self.file_id
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -152,38 +210,69 @@ class TodoManager:
         if not file_id:
             return []
         try:
-            request = self.sheet_manager.drive_service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            fh.seek(0)
-            data = json.load(fh)
-            self.todo_list = data.get('todo_list', [])
-            self.trash_bin = data.get('trash_bin', [])
-            return self.todo_list
+            return self._download_list(file_id)
         except HttpError as error:
+            if error.resp.status == 404:
+                # The cached id is stale: the file was trashed or recreated.
+                self._invalidate_cached_file_id()
+                file_id = self._find_file_id()
+                if not file_id:
+                    return []
+                try:
+                    return self._download_list(file_id)
+                except HttpError as error:
+                    print(f"An error occurred: {error}")
+                    return []
             print(f"An error occurred: {error}")
             return []
 
+    def _download_list(self, file_id: str) -> list:
+        request = self.sheet_manager.drive_service.files().get_media(fileId=file_id)
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+        fh.seek(0)
+        data = orjson.loads(fh.getvalue()) if orjson else json.load(fh)
+        self.todo_list = data.get('todo_list', [])
+        self.trash_bin = data.get('trash_bin', [])
+        return self.todo_list
+
     def save_list_to_drive(self):
-        file_id = self._find_file_id()
+        file_id = self.file_id or self._find_file_id()
         data_to_save = {
             'todo_list': self.todo_list,
             'trash_bin': self.trash_bin
         }
-        with open(self.todo_file_name, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=4, ensure_ascii=False)
-        
-        media = MediaFileUpload(self.todo_file_name, mimetype='application/json')
-        
-        if file_id:
-            self.sheet_manager.drive_service.files().update(fileId=file_id, media_body=media).execute()
+        if orjson:
+            payload = orjson.dumps(data_to_save, option=orjson.OPT_INDENT_2)
         else:
+            payload = json.dumps(data_to_save, indent=4, ensure_ascii=False).encode('utf-8')
+        payload_hash = hashlib.blake2b(payload, digest_size=8).digest()
+        if file_id and payload_hash == self._last_saved_hash:
+            return
+        media = MediaIoBaseUpload(io.BytesIO(payload), mimetype='application/json', resumable=False)
+
+        if file_id:
+            try:
+                self.sheet_manager.drive_service.files().update(fileId=file_id, media_body=media).execute()
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                # The cached id is stale: re-search and retry, or fall through
+                # to the create branch if the file is truly gone.
+                self._invalidate_cached_file_id()
+                file_id = self._find_file_id()
+                if file_id:
+                    self.sheet_manager.drive_service.files().update(fileId=file_id, media_body=media).execute()
+        if not file_id:
             file_metadata = {'name': self.todo_file_name}
             file = self.sheet_manager.drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
             self.file_id = file.get('id')
+            if self.file_id:
+                self._cache_file_id(self.file_id)
+        self._last_saved_hash = payload_hash
 
     # ... other TodoManager methods ...
 
@@ -193,11 +282,29 @@ sheet_manager.load_data()
 todo_manager = TodoManager(sheet_manager)
 
 # --- Anvil Server Functions ---
+_CALL_CACHE = {}
+_CALL_CACHE_TTL = 30  # seconds
+
+def _ttl_cached(fn):
+    """Cache a read-only server call per argument tuple for a short TTL."""
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, frozenset(kwargs.items()))
+        hit = _CALL_CACHE.get(key)
+        now = time.time()
+        if hit is not None and now - hit[0] < _CALL_CACHE_TTL:
+            return hit[1]
+        value = fn(*args, **kwargs)
+        _CALL_CACHE[key] = (now, value)
+        return value
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
 @anvil.server.callable
 def get_all_ap_codes():
     return ALL_AP_CODES
 
 @anvil.server.callable
+@_ttl_cached
 def load_translations(language):
     try:
         df = pd.read_csv("translations.csv", encoding="utf-8")
@@ -213,37 +320,15 @@ def load_translations(language):
         raise Exception(f"Unexpected error: {str(e)}")
 
 @anvil.server.callable
+@_ttl_cached
 def get_apartment_data(ap_code):
     return sheet_manager.get_apartment_data(ap_code)
 
 @anvil.server.callable
+@_ttl_cached
 def get_apartments_by_realtor(realtor_name):
     return sheet_manager.get_apartments_by_realtor(realtor_name)
 
-@anvil.server.callable
-def calculate_and_format_utilities(ap_code, include_rent):
-    return sheet_manager.calculate_and_format_utilities(ap_code, include_rent)
-
-@anvil.server.callable
-def generate_master_report(ap_code):
-    return sheet_manager.generate_master_report(ap_code)
-
-@anvil.server.callable
-def format_email_log(ap_code):
-    return sheet_manager.format_email_log(ap_code)
-
-@anvil.server.callable
-def generate_batch_report(codes_to_process):
-    return sheet_manager.generate_batch_report(codes_to_process)
-
-@anvil.server.callable
-def find_ap_code_by_email(email):
-    return sheet_manager.find_ap_code_by_email(email)
-
-@anvil.server.callable
-def find_email_by_ap_code(ap_code):
-    return sheet_manager.find_email_by_ap_code(ap_code)
-
 @anvil.server.callable
 def get_todo_list():
     return todo_manager.todo_list
@@ -253,38 +338,7 @@ def get_trash_bin():
     return todo_manager.trash_bin
 
 @anvil.server.callable
-def generate_todo_list(start_date, end_date):
-    todo_manager.generate_list(start_date, end_date)
-
-@anvil.server.callable
-def add_manual_todo_item(ap_code, due_date):
-    return todo_manager.add_manual_item(ap_code, due_date)
-
-@anvil.server.callable
-def remove_todo_item(ap_code, due_date):
-    return todo_manager.remove_item(ap_code, due_date)
-
-@anvil.server.callable
-def restore_todo_item(ap_code, due_date):
-    return todo_manager.restore_item(ap_code, due_date)
-
-@anvil.server.callable
-def update_todo_checkbox(ap_code, checkbox_name, is_checked, due_date):
-    todo_manager.update_checkbox(ap_code, checkbox_name, is_checked, due_date)
-
-@anvil.server.callable
-def update_todo_note(ap_code, new_note_text, due_date):
-    todo_manager.update_note(ap_code, new_note_text, due_date)
-
-@anvil.server.callable
-def save_todo_list():
-    todo_manager.save_list_to_drive()
-
-@anvil.server.callable
-def reload_todo_list():
-    return todo_manager.reload_from_drive()
-
-@anvil.server.callable
+@_ttl_cached
 def get_settings():
     return sheet_manager.settings
 
@@ -292,14 +346,47 @@ def get_settings():
 def save_settings(settings):
     sheet_manager.settings = settings
     sheet_manager.save_settings()
+    _CALL_CACHE.clear()
 
 @anvil.server.callable
 def sync_exchange_rate():
-    return sheet_manager.sync_exchange_rate()
+    result = sheet_manager.sync_exchange_rate()
+    _CALL_CACHE.clear()
+    return result
 
 @anvil.server.callable
 def reload_all_data():
-    return sheet_manager.reload_all_data()
+    result = sheet_manager.reload_all_data()
+    _CALL_CACHE.clear()
+    return result
+
+# Thin pass-throughs to manager methods, registered in a loop so they share one
+# closure. getattr resolves at call time, matching the old wrappers' laziness.
+_PASSTHROUGH_CALLABLES = {
+    'calculate_and_format_utilities': (sheet_manager, 'calculate_and_format_utilities'),
+    'generate_master_report': (sheet_manager, 'generate_master_report'),
+    'format_email_log': (sheet_manager, 'format_email_log'),
+    'generate_batch_report': (sheet_manager, 'generate_batch_report'),
+    'find_ap_code_by_email': (sheet_manager, 'find_ap_code_by_email'),
+    'find_email_by_ap_code': (sheet_manager, 'find_email_by_ap_code'),
+    'generate_todo_list': (todo_manager, 'generate_list'),
+    'add_manual_todo_item': (todo_manager, 'add_manual_item'),
+    'remove_todo_item': (todo_manager, 'remove_item'),
+    'restore_todo_item': (todo_manager, 'restore_item'),
+    'update_todo_checkbox': (todo_manager, 'update_checkbox'),
+    'update_todo_note': (todo_manager, 'update_note'),
+    'save_todo_list': (todo_manager, 'save_list_to_drive'),
+    'reload_todo_list': (todo_manager, 'reload_from_drive'),
+}
+
+def _register_passthroughs():
+    for public_name, (target, method_name) in _PASSTHROUGH_CALLABLES.items():
+        def _call(*args, _target=target, _method=method_name, **kwargs):
+            return getattr(_target, _method)(*args, **kwargs)
+        _call.__name__ = public_name
+        anvil.server.callable(_call)
+
+_register_passthroughs()
 
 if __name__ == "__main__":
     anvil.server.wait_forever()